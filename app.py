@@ -5,33 +5,74 @@ Flask Web Application for Screenshot Search Tool
 
 import os
 import json
-from flask import Flask, render_template, request, jsonify, send_from_directory
+import tempfile
+from flask import Flask, Request, current_app, render_template, request, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
 from pathlib import Path
 from dotenv import load_dotenv
 import shutil
 
 # Import our existing modules
-from index_screenshots import get_image_description, load_descriptions, save_descriptions
+from index_screenshots import DEFAULT_FILE_MODE, SCREENSHOTS_FOLDER, SUPPORTED_FORMATS, add_descriptions, ensure_embeddings, get_image_descriptions, load_descriptions
 from search_screenshots import search_screenshots
 
 # Load environment variables
 load_dotenv()
 
+class StreamedUploadRequest(Request):
+    """Request that spools uploaded files straight to disk in the upload folder.
+    
+    The multipart parser writes each file part into a temp file next to its
+    final location as it reads the body, so uploads never sit in worker memory
+    and can be linked into place without copying.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spooled = tempfile.NamedTemporaryFile('wb+', dir=current_app.config['UPLOAD_FOLDER'],
+                                              prefix='.upload-', delete=False)
+        self.spooled_paths = getattr(self, 'spooled_paths', []) + [spooled.name]
+        return spooled
+
 app = Flask(__name__)
+app.request_class = StreamedUploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = 'screenshots'
+app.config['UPLOAD_FOLDER'] = SCREENSHOTS_FOLDER
 app.config['DESCRIPTIONS_FILE'] = 'screenshot_descriptions.json'
+app.config['EMBEDDINGS_FILE'] = 'embeddings.npy'
+app.config['FILENAMES_FILE'] = 'filenames.json'
 
-SUPPORTED_FORMATS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
+SCREENSHOT_MAX_AGE = 365 * 24 * 60 * 60  # One year
+
+# Uploads are spooled into the upload folder, so it must exist before any request
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 def allowed_file(filename):
-    """Check if file extension is allowed."""
-    return '.' in filename and Path(filename).suffix.lower() in SUPPORTED_FORMATS
+    """Check if file extension is allowed (and there is a name before it)."""
+    stem, _, ext = filename.rpartition('.')
+    return bool(stem) and '.' + ext.lower() in SUPPORTED_FORMATS
+
+def save_upload(file, filepath):
+    """Move a spooled upload into place without copying its bytes.
+    
+    Hard-linking fails instead of replacing an existing file, so a concurrent
+    upload of the same name can't overwrite it. Returns False in that case.
+    """
+    file.stream.flush()
+    os.chmod(file.stream.name, DEFAULT_FILE_MODE)
+    try:
+        os.link(file.stream.name, filepath)
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(file.stream.name)
+    return True
 
-def file_exists_in_screenshots(filename):
-    """Check if file already exists in screenshots folder."""
-    return os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+@app.teardown_request
+def remove_spooled_uploads(exc):
+    """Delete temp files for uploads that were rejected or never saved."""
+    for path in getattr(request, 'spooled_paths', []):
+        if os.path.exists(path):
+            os.remove(path)
 
 @app.route('/')
 def index():
@@ -49,14 +90,18 @@ def upload_files():
         return jsonify({'error': 'No files selected'}), 400
     
     results = []
-    descriptions = load_descriptions(app.config['DESCRIPTIONS_FILE'])
+    saved = []
+    new_descriptions = {}
+    existing = set(os.listdir(app.config['UPLOAD_FOLDER']))
     
     for file in files:
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
+        # Check the sanitized name, which is what gets saved and later indexed
+        filename = secure_filename(file.filename) if file else ''
+        if file and allowed_file(filename):
             
-            # Check if file already exists
-            if file_exists_in_screenshots(filename):
+            # Check if file already exists (save_upload re-checks atomically)
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            if filename in existing or not save_upload(file, filepath):
                 results.append({
                     'filename': filename,
                     'status': 'skipped',
@@ -64,26 +109,10 @@ def upload_files():
                 })
                 continue
             
-            # Save file
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Get description from GPT-4 Vision
-            description = get_image_description(filepath)
-            
-            if description:
-                descriptions[filepath] = description
-                results.append({
-                    'filename': filename,
-                    'status': 'success',
-                    'message': 'File uploaded and processed'
-                })
-            else:
-                results.append({
-                    'filename': filename,
-                    'status': 'error',
-                    'message': 'Failed to process image'
-                })
+            existing.add(filename)
+            # Placeholder filled in once the batch is described, to keep upload order
+            saved.append((len(results), filename, filepath))
+            results.append(None)
         else:
             results.append({
                 'filename': file.filename,
@@ -91,8 +120,28 @@ def upload_files():
                 'message': 'Invalid file type'
             })
     
-    # Save updated descriptions
-    save_descriptions(descriptions, app.config['DESCRIPTIONS_FILE'])
+    # Get descriptions from GPT-4 Vision for the whole batch at once
+    batch_descriptions = get_image_descriptions([filepath for _, _, filepath in saved])
+    
+    for (i, filename, filepath), description in zip(saved, batch_descriptions):
+        if description:
+            new_descriptions[filepath] = description
+            results[i] = {
+                'filename': filename,
+                'status': 'success',
+                'message': 'File uploaded and processed'
+            }
+        else:
+            results[i] = {
+                'filename': filename,
+                'status': 'error',
+                'message': 'Failed to process image'
+            }
+    
+    # Merge into the saved descriptions (re-read under a lock, so concurrent
+    # uploads in other workers aren't lost) and embed the new ones for search
+    add_descriptions(new_descriptions, app.config['DESCRIPTIONS_FILE'],
+                     app.config['EMBEDDINGS_FILE'], app.config['FILENAMES_FILE'])
     
     return jsonify({
         'results': results,
@@ -113,7 +162,12 @@ def search():
     if not descriptions:
         return jsonify({'error': 'No screenshots indexed yet'}), 400
     
-    results = search_screenshots(query, descriptions, top_k=5)
+    # Descriptions indexed before embedding search existed are embedded on first search
+    ensure_embeddings(app.config['DESCRIPTIONS_FILE'], app.config['EMBEDDINGS_FILE'], app.config['FILENAMES_FILE'])
+    
+    results = search_screenshots(query, descriptions, top_k=5,
+                                 embeddings_file=app.config['EMBEDDINGS_FILE'],
+                                 filenames_file=app.config['FILENAMES_FILE'])
     
     # Format results for frontend
     formatted_results = []
@@ -134,8 +188,16 @@ def search():
 
 @app.route('/screenshots/<filename>')
 def uploaded_file(filename):
-    """Serve uploaded screenshots."""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Serve uploaded screenshots.
+    
+    Uploads never overwrite an existing filename, so a screenshot's bytes never
+    change and browsers can cache it indefinitely.
+    """
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename,
+                                   conditional=True, max_age=SCREENSHOT_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/status')
 def status():
@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for serving the Screenshot Search Tool in production
+
+Usage: gunicorn app:app
+"""
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+
+# Requests spend most of their time waiting on the OpenAI API, so a few
+# processes with many threads each keep uploads and searches from blocking
+# one another without multiplying the in-memory index per worker.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+# Vision calls are capped per worker (index_screenshots.MAX_CONCURRENT_REQUESTS),
+# so the process-wide total is workers x that cap
+
+# Batch uploads wait on many Vision calls before responding
+timeout = 120
+keepalive = 5
+
+# Serve screenshot files with sendfile(2) instead of copying through Python
+sendfile = True
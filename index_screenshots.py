@@ -6,74 +6,493 @@ Screenshot Indexing Tool - Generates JSON descriptions using GPT-4 Vision API
 import os
 import json
 import argparse
+import asyncio
 import base64
+import fcntl
+import io
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
-from openai import OpenAI
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+import blake3
+import numpy as np
+import orjson
+from PIL import Image
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 
+try:
+    import faiss
+except ImportError:  # Fall back to brute-force NumPy search
+    faiss = None
+
 # Load environment variables
 load_dotenv()
 
 # Initialize OpenAI client
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Public base URL of the Flask app (e.g. https://example.com). When set, images in
+# the screenshots folder are passed to Vision by URL instead of inlined as base64.
+PUBLIC_HOST = os.getenv("PUBLIC_HOST", "").rstrip("/")
+SCREENSHOTS_FOLDER = "screenshots"  # Also the Flask app's UPLOAD_FOLDER
+
 DESCRIPTIONS_FILE = "screenshot_descriptions.json"
-SUPPORTED_FORMATS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
+DESCRIPTION_CACHE_FILE = "description_cache.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+FILENAMES_FILE = "filenames.json"
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+EMBEDDING_BLOCK_ROWS = 65536  # Rows copied or dequantized at a time when rewriting the index
+EMBEDDING_BATCH_SIZE = 128  # Descriptions per embeddings request (the API accepts up to 2048)
+HNSW_NEIGHBORS = 32
+SUPPORTED_FORMATS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')  # Tuple so str.endswith can take it directly
+VISION_MODEL = "gpt-4o"
+# Vision scales images to fit 2048x2048 and then to 768px on the short side,
+# so any pixels beyond that are uploaded only to be thrown away.
+MAX_IMAGE_SIDE = 2048
+MAX_IMAGE_SHORT_SIDE = 768
+JPEG_QUALITY = 85
+# Bump whenever encode_image changes what Vision sees, so cached descriptions of
+# the same bytes made with the old preprocessing are not reused
+IMAGE_ENCODING_VERSION = 2
+# Vision calls in flight at once, shared by every batch and thread in the process
+# (so per Gunicorn worker), to stay under OpenAI RPM limits
+MAX_CONCURRENT_REQUESTS = 20
+ENCODE_WORKERS = 8  # Threads reading, hashing and encoding images while requests are in flight
+VISION_PROMPT = "Analyze this image and provide a description based on the following rules:\n\n1. IF the image contains text, UI elements, buttons, menus, forms, error messages, or any digital interface elements:\n   - Provide a detailed description including ALL visible text, UI elements, colors, buttons, error messages, and any other visual elements that someone might search for.\n\n2. IF the image is purely visual content without text (like nature photos, objects, people, etc.):\n   - Provide only ONE descriptive sentence focusing on the main visual elements, colors, and objects.\n\nAnalyze the image and apply the appropriate rule."
+
+# Mode a plain open() would create files with (mkstemp and NamedTemporaryFile use 0600).
+# Read once at import, since os.umask can only be queried by setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+DEFAULT_FILE_MODE = 0o666 & ~_UMASK
+
+_vision_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+# Parsed JSON files keyed by path: {path: ((mtime_ns, size), data)}
+_descriptions_cache = {}
+
+def has_transparency(img: Image.Image) -> bool:
+    """Whether the image carries an alpha channel or a transparent palette entry."""
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+def flatten_to_rgb(img: Image.Image) -> Image.Image:
+    """Convert to RGB, compositing any transparency onto white (JPEG has no alpha)."""
+    if has_transparency(img):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, rgba).convert("RGB")
+    return img.convert("RGB")
 
 def encode_image(image_path: str) -> str:
-    """Encode image to base64 string."""
+    """Downscale image to the size Vision would use, re-encode as JPEG and return it as a base64 string."""
+    with Image.open(image_path) as img:
+        width, height = img.size
+        scale = min(1.0, MAX_IMAGE_SIDE / max(width, height), MAX_IMAGE_SHORT_SIDE / min(width, height))
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # Let the JPEG decoder skip detail we are about to discard anyway
+        img.draft("RGB", size)
+        # Palette and other modes Pillow can't Lanczos-resample; keep alpha if any
+        if img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA" if has_transparency(img) else "RGB")
+        if img.size != size:
+            # Alpha modes are resampled premultiplied, so edges don't pick up dark fringes
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        # Flatten after resizing, so compositing runs on the smaller image
+        img = flatten_to_rgb(img)
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=JPEG_QUALITY)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def image_url(image_path: str) -> str:
+    """URL Vision should fetch the image from: the app's public URL if served, else a data URI."""
+    path = Path(image_path).resolve()
+    if PUBLIC_HOST and path.parent == Path(SCREENSHOTS_FOLDER).resolve():
+        return f"{PUBLIC_HOST}/screenshots/{quote(path.name)}"
+    return f"data:image/jpeg;base64,{encode_image(image_path)}"
+
+def build_vision_messages(image_path: str) -> List[dict]:
+    """Build the chat messages asking GPT-4 Vision to describe an image."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": VISION_PROMPT
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url(image_path)
+                    }
+                }
+            ]
+        }
+    ]
+
+def image_cache_key(image_path: str) -> str:
+    """Content-addressed cache key: the Vision model, encoding version and blake3 digest of the image bytes."""
+    hasher = blake3.blake3()
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        for chunk in iter(lambda: image_file.read(1 << 20), b""):
+            hasher.update(chunk)
+    return f"{VISION_MODEL}:v{IMAGE_ENCODING_VERSION}:{hasher.hexdigest()}"
+
+def try_image_cache_key(image_path: str) -> Optional[str]:
+    """Like image_cache_key, but logs and returns None if the image can't be read."""
+    try:
+        return image_cache_key(image_path)
+    except OSError as e:
+        print(f"Error processing {image_path}: {str(e)}")
+        return None
+
+def get_image_description(image_path: str, cache_file: str = DESCRIPTION_CACHE_FILE) -> str:
+    """Get description of an image, reusing the cached one if identical bytes were described before."""
+    cache = load_descriptions(cache_file)
+    key = try_image_cache_key(image_path)
+    if key is None:
+        return ""
+    if key in cache:
+        return cache[key]
+    
+    description = request_image_description(image_path)
+    if description:
+        merge_descriptions({key: description}, cache_file)
+    return description
 
-def get_image_description(image_path: str) -> str:
+def request_image_description(image_path: str) -> str:
     """Get description of an image using GPT-4 Vision API."""
     try:
-        base64_image = encode_image(image_path)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Analyze this image and provide a description based on the following rules:\n\n1. IF the image contains text, UI elements, buttons, menus, forms, error messages, or any digital interface elements:\n   - Provide a detailed description including ALL visible text, UI elements, colors, buttons, error messages, and any other visual elements that someone might search for.\n\n2. IF the image is purely visual content without text (like nature photos, objects, people, etc.):\n   - Provide only ONE descriptive sentence focusing on the main visual elements, colors, and objects.\n\nAnalyze the image and apply the appropriate rule."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=500
-        )
+        messages = build_vision_messages(image_path)
+        with _vision_slots:
+            response = client.chat.completions.create(
+                model=VISION_MODEL,
+                messages=messages,
+                max_tokens=500
+            )
         
         return response.choices[0].message.content
     except Exception as e:
         print(f"Error processing {image_path}: {str(e)}")
         return ""
 
+async def _acquire_vision_slot() -> None:
+    """Wait for a process-wide Vision slot without blocking the event loop."""
+    # Polled rather than acquired on a thread, so waiters can't exhaust the
+    # default executor that the in-flight requests need for DNS lookups
+    while not _vision_slots.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+
+async def get_image_description_async(image_path: str, async_client: AsyncOpenAI, sem: asyncio.Semaphore,
+                                      executor: Optional[Executor] = None) -> str:
+    """Get description of an image using GPT-4 Vision API without blocking other requests.
+    
+    Reading and encoding the image runs on executor so it overlaps with other
+    requests' network time instead of stalling the event loop.
+    """
+    async with sem:
+        try:
+            loop = asyncio.get_running_loop()
+            messages = await loop.run_in_executor(executor, build_vision_messages, image_path)
+            await _acquire_vision_slot()
+            try:
+                response = await async_client.chat.completions.create(
+                    model=VISION_MODEL,
+                    messages=messages,
+                    max_tokens=500
+                )
+            finally:
+                _vision_slots.release()
+            
+            return response.choices[0].message.content
+        except Exception as e:
+            print(f"Error processing {image_path}: {str(e)}")
+            return ""
+
+async def _describe_images(image_paths: List[str], max_concurrency: int) -> List[str]:
+    sem = asyncio.Semaphore(max_concurrency)
+    with ThreadPoolExecutor(max_workers=ENCODE_WORKERS) as executor:
+        async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) as async_client:
+            tasks = [get_image_description_async(path, async_client, sem, executor) for path in image_paths]
+            return await asyncio.gather(*tasks)
+
+def get_image_descriptions(image_paths: List[str], max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                           cache_file: str = DESCRIPTION_CACHE_FILE) -> List[str]:
+    """Describe a batch of images concurrently; results are in input order.
+    
+    Images whose bytes were already described (under any filename) are served
+    from the cache, and duplicates within the batch are only sent once.
+    """
+    if not image_paths:
+        return []
+    
+    cache = load_descriptions(cache_file)
+    with ThreadPoolExecutor(max_workers=ENCODE_WORKERS) as executor:
+        keys = list(executor.map(try_image_cache_key, image_paths))
+    
+    # Unreadable images have no key and are reported as failed ("")
+    missing = {}
+    for path, key in zip(image_paths, keys):
+        if key is not None and key not in cache and key not in missing:
+            missing[key] = path
+    
+    if missing:
+        fresh = asyncio.run(_describe_images(list(missing.values()), max_concurrency))
+        new_entries = {key: description for key, description in zip(missing, fresh) if description}
+        if new_entries:
+            cache = merge_descriptions(new_entries, cache_file)
+    
+    return [cache.get(key, "") if key is not None else "" for key in keys]
+
 def load_descriptions(file_path: str) -> Dict[str, str]:
-    """Load existing descriptions from JSON file."""
-    if os.path.exists(file_path):
+    """Load existing descriptions from JSON file.
+    
+    The parsed file is cached per path and only re-read when its mtime or size
+    changes; callers get a shallow copy they are free to modify.
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return {}
+    
+    version = (st.st_mtime_ns, st.st_size)
+    cached = _descriptions_cache.get(file_path)
+    if cached is None or cached[0] != version:
         try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
+            with open(file_path, 'rb') as f:
+                data = orjson.loads(f.read())
+        except (orjson.JSONDecodeError, FileNotFoundError):
             return {}
-    return {}
+        cached = _descriptions_cache[file_path] = (version, data)
+    return dict(cached[1])
+
+@contextmanager
+def atomic_path(file_path: str):
+    """Yield a temp path next to file_path that is renamed over it on success.
+    
+    Readers never see a partially written file, and processes that have the old
+    file memory-mapped keep their (now unlinked) copy intact.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp_path
+        # mkstemp creates 0600; keep the replaced file's mode, or what open() would have used
+        try:
+            mode = os.stat(file_path).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = DEFAULT_FILE_MODE
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+@contextmanager
+def atomic_open(file_path: str):
+    """Open a temp file for binary writing that is renamed over file_path on success."""
+    with atomic_path(file_path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            yield f
 
 def save_descriptions(descriptions: Dict[str, str], file_path: str) -> None:
-    """Save descriptions to JSON file."""
-    with open(file_path, 'w') as f:
-        json.dump(descriptions, f, indent=2)
+    """Save descriptions to JSON file atomically."""
+    data = orjson.dumps(descriptions, option=orjson.OPT_INDENT_2)
+    with atomic_open(file_path) as f:
+        f.write(data)
+    
+    st = os.stat(file_path)
+    _descriptions_cache[file_path] = ((st.st_mtime_ns, st.st_size), dict(descriptions))
+
+@contextmanager
+def locked(file_path: str):
+    """Hold an exclusive lock on file_path (via a sidecar .lock file) for a read-modify-write."""
+    with open(file_path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _merge_descriptions_unlocked(new_entries: Dict[str, str], file_path: str) -> Dict[str, str]:
+    descriptions = load_descriptions(file_path)
+    descriptions.update(new_entries)
+    save_descriptions(descriptions, file_path)
+    return descriptions
+
+def merge_descriptions(new_entries: Dict[str, str], file_path: str) -> Dict[str, str]:
+    """Add entries to a descriptions file without losing concurrent writers' entries.
+    
+    The file is re-read under the lock, so entries saved by another process
+    since our first load are kept. Returns the merged descriptions.
+    """
+    with locked(file_path):
+        return _merge_descriptions_unlocked(new_entries, file_path)
+
+def add_descriptions(new_entries: Dict[str, str], descriptions_file: str, embeddings_file: str = EMBEDDINGS_FILE,
+                     filenames_file: str = FILENAMES_FILE) -> Tuple[Dict[str, str], int]:
+    """Merge new image descriptions into the index and embed them under one lock.
+    
+    Returns the merged descriptions and the number of newly embedded ones.
+    """
+    with locked(descriptions_file):
+        descriptions = _merge_descriptions_unlocked(new_entries, descriptions_file)
+        embedded = update_embeddings(descriptions, embeddings_file, filenames_file)
+    return descriptions, embedded
+
+def ensure_embeddings(descriptions_file: str, embeddings_file: str = EMBEDDINGS_FILE,
+                      filenames_file: str = FILENAMES_FILE) -> int:
+    """Embed an index created before embedding search existed. Returns the number embedded.
+    
+    Only does work when the embeddings file is missing, so it is cheap to call
+    before every search.
+    """
+    if os.path.exists(embeddings_file):
+        return 0
+    return add_descriptions({}, descriptions_file, embeddings_file, filenames_file)[1]
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize vectors along the last axis in place, so cosine similarity is a plain dot product."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+def get_embeddings(texts: List[str]) -> Optional[np.ndarray]:
+    """Get L2-normalized embeddings for a batch of texts in a single API call."""
+    try:
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    except Exception as e:
+        print(f"Error embedding {len(texts)} texts: {str(e)}")
+        return None
+    
+    vectors = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    for item in response.data:
+        vectors[item.index] = item.embedding
+    return l2_normalize(vectors)
 
-def index_screenshots(folder_path: str, output_file: str) -> None:
+def quantize_embeddings(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantize float embeddings to int8 codes with one float32 scale per row."""
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(embeddings / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def dequantize_embeddings(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Reconstruct approximate float32 embeddings from int8 codes."""
+    return codes.astype(np.float32) * scales[:, None]
+
+def scales_path(embeddings_file: str) -> str:
+    """Path of the per-row quantization scales stored alongside an embeddings file."""
+    return os.path.splitext(embeddings_file)[0] + ".scales.npy"
+
+def load_embeddings(embeddings_file: str, filenames_file: str,
+                    mmap_mode: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Load the int8 embedding codes, their scales and the parallel list of filenames.
+    
+    With mmap_mode='r' the arrays are memory-mapped rather than read, so loading
+    is constant-time and processes searching the same files share their pages.
+    """
+    if os.path.exists(embeddings_file) and os.path.exists(filenames_file):
+        try:
+            with open(filenames_file, 'r') as f:
+                filenames = json.load(f)
+            codes = np.load(embeddings_file, mmap_mode=mmap_mode)
+            if codes.dtype != np.int8:
+                # Index written before quantization: convert it in memory
+                codes, scales = quantize_embeddings(codes.astype(np.float32))
+            else:
+                scales = np.load(scales_path(embeddings_file), mmap_mode=mmap_mode)
+            if codes.shape == (len(filenames), EMBEDDING_DIM) and scales.shape == (len(filenames),):
+                return codes, scales, filenames
+        except (json.JSONDecodeError, ValueError, OSError):
+            pass
+    return np.empty((0, EMBEDDING_DIM), dtype=np.int8), np.empty(0, dtype=np.float32), []
+
+def append_embeddings(codes: np.ndarray, scales: np.ndarray, new_codes: np.ndarray, new_scales: np.ndarray,
+                      filenames: List[str], embeddings_file: str, filenames_file: str) -> None:
+    """Save the existing embedding codes plus new rows, their scales and the parallel list of filenames.
+    
+    The existing codes are copied into the new file in blocks, so memory use
+    stays bounded however large the index grows.
+    """
+    total = len(codes) + len(new_codes)
+    with atomic_path(embeddings_file) as tmp_path:
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int8, shape=(total, EMBEDDING_DIM))
+        for start in range(0, len(codes), EMBEDDING_BLOCK_ROWS):
+            stop = min(start + EMBEDDING_BLOCK_ROWS, len(codes))
+            out[start:stop] = codes[start:stop]
+        out[len(codes):] = new_codes
+        out.flush()
+        del out
+    with atomic_open(scales_path(embeddings_file)) as f:
+        np.save(f, np.concatenate([scales, new_scales]))
+    with atomic_open(filenames_file) as f:
+        f.write(orjson.dumps(filenames, option=orjson.OPT_INDENT_2))
+
+def faiss_index_path(embeddings_file: str) -> str:
+    """Path of the FAISS index stored alongside an embeddings file."""
+    return os.path.splitext(embeddings_file)[0] + ".faiss"
+
+def build_faiss_index(codes: np.ndarray, scales: np.ndarray, train_rows: np.ndarray):
+    """Build an 8-bit scalar-quantized HNSW inner-product index over the existing embeddings."""
+    index = faiss.IndexHNSWSQ(EMBEDDING_DIM, faiss.ScalarQuantizer.QT_8bit_uniform, HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+    if len(codes):
+        train_rows = dequantize_embeddings(codes[:EMBEDDING_BLOCK_ROWS], scales[:EMBEDDING_BLOCK_ROWS])
+    index.train(np.ascontiguousarray(train_rows, dtype=np.float32))
+    for start in range(0, len(codes), EMBEDDING_BLOCK_ROWS):
+        index.add(dequantize_embeddings(codes[start:start + EMBEDDING_BLOCK_ROWS],
+                                        scales[start:start + EMBEDDING_BLOCK_ROWS]))
+    return index
+
+def update_faiss_index(codes: np.ndarray, scales: np.ndarray, new_rows: np.ndarray, index_file: str) -> None:
+    """Add new rows to the FAISS index on disk, rebuilding it only if it is missing or out of sync."""
+    if faiss is None:
+        return
+    index = None
+    if os.path.exists(index_file):
+        try:
+            index = faiss.read_index(index_file)
+        except RuntimeError:
+            index = None
+    if index is None or index.ntotal != len(codes):
+        index = build_faiss_index(codes, scales, new_rows)
+    index.add(np.ascontiguousarray(new_rows, dtype=np.float32))
+    with atomic_path(index_file) as tmp_path:
+        faiss.write_index(index, tmp_path)
+
+def update_embeddings(descriptions: Dict[str, str], embeddings_file: str = EMBEDDINGS_FILE, filenames_file: str = FILENAMES_FILE) -> int:
+    """Embed any descriptions not yet in the embedding index. Returns the number added."""
+    # Memory-mapped, so nothing proportional to the index is read unless rows are added
+    codes, scales, filenames = load_embeddings(embeddings_file, filenames_file, mmap_mode='r')
+    indexed = set(filenames)
+    pending = [(filename, description) for filename, description in descriptions.items() if filename not in indexed]
+    if not pending:
+        return 0
+    
+    vectors = np.empty((len(pending), EMBEDDING_DIM), dtype=np.float32)
+    embedded = np.zeros(len(pending), dtype=bool)
+    for start in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+        batch = pending[start:start + EMBEDDING_BATCH_SIZE]
+        batch_vectors = get_embeddings([description for _, description in batch])
+        if batch_vectors is not None:
+            vectors[start:start + len(batch)] = batch_vectors
+            embedded[start:start + len(batch)] = True
+    
+    new_rows = vectors[embedded]
+    if len(new_rows):
+        new_codes, new_scales = quantize_embeddings(new_rows)
+        new_filenames = filenames + [filename for (filename, _), ok in zip(pending, embedded) if ok]
+        append_embeddings(codes, scales, new_codes, new_scales, new_filenames, embeddings_file, filenames_file)
+        update_faiss_index(codes, scales, dequantize_embeddings(new_codes, new_scales), faiss_index_path(embeddings_file))
+    return len(new_rows)
+
+def index_screenshots(folder_path: str, output_file: str, embeddings_file: str = EMBEDDINGS_FILE, filenames_file: str = FILENAMES_FILE) -> None:
     """Index all screenshots in the given folder."""
     folder = Path(folder_path)
     if not folder.exists():
@@ -82,11 +501,8 @@ def index_screenshots(folder_path: str, output_file: str) -> None:
     
     descriptions = load_descriptions(output_file)
     
-    # Find all image files
-    image_files = []
-    for ext in SUPPORTED_FORMATS:
-        image_files.extend(folder.glob(f"*{ext}"))
-        image_files.extend(folder.glob(f"*{ext.upper()}"))
+    # Find all image files in a single directory scan
+    image_files = [p for p in folder.iterdir() if p.name.lower().endswith(SUPPORTED_FORMATS) and p.is_file()]
     
     if not image_files:
         print(f"No image files found in '{folder_path}'")
@@ -94,7 +510,7 @@ def index_screenshots(folder_path: str, output_file: str) -> None:
     
     print(f"Found {len(image_files)} image files to process...")
     
-    processed = 0
+    pending = []
     for image_path in image_files:
         filename = str(image_path)
         
@@ -103,21 +519,23 @@ def index_screenshots(folder_path: str, output_file: str) -> None:
             print(f"Skipping {filename} (already processed)")
             continue
         
-        print(f"Processing {filename}...")
-        description = get_image_description(str(image_path))
-        
+        pending.append(filename)
+    
+    print(f"Processing {len(pending)} images...")
+    new_descriptions = {}
+    for filename, description in zip(pending, get_image_descriptions(pending)):
         if description:
-            descriptions[filename] = description
-            processed += 1
+            new_descriptions[filename] = description
             print(f"✓ Processed {filename}")
         else:
             print(f"✗ Failed to process {filename}")
     
-    save_descriptions(descriptions, output_file)
-    print(f"\nIndexing complete! Processed {processed} new images.")
+    descriptions, embedded = add_descriptions(new_descriptions, output_file, embeddings_file, filenames_file)
+    print(f"\nIndexing complete! Processed {len(new_descriptions)} new images.")
+    print(f"Embedded {embedded} new descriptions into '{embeddings_file}'")
     print(f"Total images in index: {len(descriptions)}")
 
-def process_single_image(image_path: str, descriptions_file: str) -> bool:
+def process_single_image(image_path: str, descriptions_file: str, embeddings_file: str = EMBEDDINGS_FILE, filenames_file: str = FILENAMES_FILE) -> bool:
     """Process a single image and add to descriptions file."""
     descriptions = load_descriptions(descriptions_file)
     
@@ -126,8 +544,7 @@ def process_single_image(image_path: str, descriptions_file: str) -> bool:
     
     description = get_image_description(image_path)
     if description:
-        descriptions[image_path] = description
-        save_descriptions(descriptions, descriptions_file)
+        add_descriptions({image_path: description}, descriptions_file, embeddings_file, filenames_file)
         return True
     return False
 
@@ -135,10 +552,12 @@ def main():
     parser = argparse.ArgumentParser(description="Index screenshots using GPT-4 Vision API")
     parser.add_argument('--folder', required=True, help='Path to folder containing screenshots')
     parser.add_argument('--output', default=DESCRIPTIONS_FILE, help=f'Output JSON file (default: {DESCRIPTIONS_FILE})')
+    parser.add_argument('--embeddings', default=EMBEDDINGS_FILE, help=f'Output embeddings file (default: {EMBEDDINGS_FILE})')
+    parser.add_argument('--filenames', default=FILENAMES_FILE, help=f'Output filenames file for the embeddings (default: {FILENAMES_FILE})')
     
     args = parser.parse_args()
     
-    index_screenshots(args.folder, args.output)
+    index_screenshots(args.folder, args.output, args.embeddings, args.filenames)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,11 +6,15 @@ Screenshot Search Tool - Finds top 5 matches from indexed screenshots
 import os
 import json
 import argparse
+import threading
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Optional, Tuple, Dict
+import numpy as np
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from index_screenshots import EMBEDDING_DIM, EMBEDDING_MODEL, EMBEDDINGS_FILE, FILENAMES_FILE, ensure_embeddings, faiss, faiss_index_path, l2_normalize, load_embeddings
+
 # Load environment variables
 load_dotenv()
 
@@ -19,6 +23,22 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 DESCRIPTIONS_FILE = "screenshot_descriptions.json"
 
+# FAISS index cached across searches, reloaded when the file on disk changes
+_faiss_cache = {"path": None, "mtime": None, "index": None}
+
+# Memory-mapped embeddings cached across searches, remapped when the files change
+_embeddings_cache = {"version": None, "data": None}
+
+# Rows of int8 embeddings dequantized at a time by the NumPy search path
+SCORE_BLOCK_ROWS = 65536
+
+# Semantic cache of past queries: a paraphrase of a recent query (cosine
+# similarity above the threshold) reuses its results instead of re-ranking.
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_SIZE = 1000
+_query_cache = {"version": None, "queries": [], "embeddings": np.empty((0, EMBEDDING_DIM), dtype=np.float32), "results": []}
+_query_cache_lock = threading.Lock()  # Searches run concurrently under threaded servers
+
 def load_descriptions(file_path: str = DESCRIPTIONS_FILE) -> Dict[str, str]:
     """Load descriptions from JSON file."""
     if not os.path.exists(file_path):
@@ -33,67 +53,133 @@ def load_descriptions(file_path: str = DESCRIPTIONS_FILE) -> Dict[str, str]:
         print(f"Error: Could not read descriptions file '{file_path}'.")
         return {}
 
-def search_screenshots(query: str, descriptions: Dict[str, str], top_k: int = 5) -> List[Tuple[str, str, int]]:
+def embed_query(query: str) -> np.ndarray:
+    """Embed a search query as an L2-normalized float32 vector."""
+    response = client.embeddings.create(model=EMBEDDING_MODEL, input=query)
+    return l2_normalize(np.asarray(response.data[0].embedding, dtype=np.float32))
+
+def load_search_embeddings(embeddings_file: str, filenames_file: str) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Memory-map the embeddings for searching, reusing the cached mapping if unchanged."""
+    try:
+        version = (embeddings_file, os.stat(embeddings_file).st_mtime_ns,
+                   filenames_file, os.stat(filenames_file).st_mtime_ns)
+    except FileNotFoundError:
+        return load_embeddings(embeddings_file, filenames_file)
+    
+    if _embeddings_cache["version"] != version:
+        _embeddings_cache.update(version=version,
+                                 data=load_embeddings(embeddings_file, filenames_file, mmap_mode='r'))
+    return _embeddings_cache["data"]
+
+def load_faiss_index(index_file: str):
+    """Load the FAISS index from disk, reusing the cached copy if unchanged.
+    
+    Where FAISS supports it (IO_FLAG_MMAP_IFC, faiss >= 1.10) the index is
+    memory-mapped read-only, so workers share its pages instead of each
+    holding a private copy. Older versions fall back to a full read. Returns
+    None if the file can't be read, so search falls back to NumPy.
+    """
+    if faiss is None or not os.path.exists(index_file):
+        return None
+    mtime = os.stat(index_file).st_mtime
+    if _faiss_cache["path"] != index_file or _faiss_cache["mtime"] != mtime:
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+        try:
+            if mmap_flag is not None:
+                index = faiss.read_index(index_file, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+            else:
+                index = faiss.read_index(index_file)
+        except RuntimeError:
+            # Truncated or corrupt; cached as None until the file is rewritten
+            index = None
+        _faiss_cache.update(path=index_file, mtime=mtime, index=index)
+    return _faiss_cache["index"]
+
+def rank_embeddings(codes: np.ndarray, scales: np.ndarray, q: np.ndarray, top_k: int, index_file: str) -> List[Tuple[int, float]]:
+    """Return (row, score) pairs for the top_k embeddings most similar to q."""
+    index = load_faiss_index(index_file)
+    if index is not None and index.ntotal == len(codes):
+        D, I = index.search(q.reshape(1, -1), top_k)
+        return [(int(i), float(d)) for i, d in zip(I[0], D[0]) if i >= 0]
+    
+    # Embeddings are L2-normalized, so the dot product is cosine similarity.
+    # Dequantize in blocks so the float32 copy never exceeds one block.
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+        block = codes[start:start + SCORE_BLOCK_ROWS]
+        scores[start:start + len(block)] = block.astype(np.float32) @ q
+    scores *= scales
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(i), float(scores[i])) for i in top]
+
+def _query_cache_for(version: tuple) -> dict:
+    """Return the query cache, clearing it if the index it was built against changed."""
+    if _query_cache["version"] != version:
+        _query_cache.update(version=version, queries=[],
+                            embeddings=np.empty((0, EMBEDDING_DIM), dtype=np.float32), results=[])
+    return _query_cache
+
+def lookup_cached_results(q: np.ndarray, version: tuple) -> Optional[List[Tuple[str, str, int]]]:
+    """Return cached results for a query semantically equivalent to q, if any."""
+    with _query_cache_lock:
+        cache = _query_cache_for(version)
+        if not cache["results"]:
+            return None
+        sims = cache["embeddings"] @ q
+        best = int(np.argmax(sims))
+        if sims[best] >= SEMANTIC_CACHE_THRESHOLD:
+            return cache["results"][best]
+        return None
+
+def store_cached_results(query: str, q: np.ndarray, results: List[Tuple[str, str, int]], version: tuple) -> None:
+    """Remember the results of a query, evicting the oldest entries past the size limit."""
+    with _query_cache_lock:
+        cache = _query_cache_for(version)
+        cache["queries"] = (cache["queries"] + [query])[-SEMANTIC_CACHE_SIZE:]
+        cache["embeddings"] = np.vstack([cache["embeddings"], q[None, :]])[-SEMANTIC_CACHE_SIZE:]
+        cache["results"] = (cache["results"] + [results])[-SEMANTIC_CACHE_SIZE:]
+
+def search_screenshots(query: str, descriptions: Dict[str, str], top_k: int = 5,
+                       embeddings_file: str = EMBEDDINGS_FILE,
+                       filenames_file: str = FILENAMES_FILE) -> List[Tuple[str, str, int]]:
     """Search for screenshots matching the query."""
     if not descriptions:
         return []
     
-    # Prepare the search prompt
-    descriptions_text = "\n".join([f"{i+1}. {filename}: {desc}" for i, (filename, desc) in enumerate(descriptions.items())])
+    codes, scales, filenames = load_search_embeddings(embeddings_file, filenames_file)
+    if not filenames:
+        print(f"Error: Embeddings file '{embeddings_file}' not found or empty.")
+        print("Please run index_screenshots.py first to create the index.")
+        return []
     
-    search_prompt = f"""Given this search query: '{query}', rank these screenshot descriptions by relevance. Return the top {top_k} matches with confidence scores (0-100).
-
-Format your response as:
-1. filename: confidence_score
-2. filename: confidence_score
-...
-
-Screenshot descriptions:
-{descriptions_text}
-"""
+    # Cached results are only valid for the index and top_k they were computed with
+    version = (embeddings_file, os.stat(embeddings_file).st_mtime, top_k)
+    with _query_cache_lock:
+        cache = _query_cache_for(version)
+        if query in cache["queries"]:
+            return cache["results"][cache["queries"].index(query)]
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "user",
-                    "content": search_prompt
-                }
-            ],
-            max_tokens=500
-        )
-        
-        results = []
-        response_text = response.choices[0].message.content
-        
-        # Parse the response to extract results
-        lines = response_text.strip().split('\n')
-        for line in lines:
-            if ':' in line and any(char.isdigit() for char in line):
-                try:
-                    # Extract filename and confidence score
-                    parts = line.split(':')
-                    if len(parts) >= 2:
-                        filename_part = parts[0].strip()
-                        score_part = parts[1].strip()
-                        
-                        # Remove numbering from filename
-                        filename = filename_part.split('. ', 1)[-1] if '. ' in filename_part else filename_part
-                        
-                        # Extract confidence score
-                        score = int(''.join(filter(str.isdigit, score_part)))
-                        
-                        if filename in descriptions:
-                            results.append((filename, descriptions[filename], score))
-                except (ValueError, IndexError):
-                    continue
-        
-        return results[:top_k]
-        
+        q = embed_query(query)
     except Exception as e:
         print(f"Error during search: {str(e)}")
         return []
+    
+    cached = lookup_cached_results(q, version)
+    if cached is not None:
+        return cached
+    
+    k = min(top_k, len(filenames))
+    results = []
+    for i, similarity in rank_embeddings(codes, scales, q, k, faiss_index_path(embeddings_file)):
+        filename = filenames[i]
+        if filename in descriptions:
+            score = int(round(max(similarity, 0.0) * 100))
+            results.append((filename, descriptions[filename], score))
+    
+    store_cached_results(query, q, results, version)
+    return results
 
 def display_results(results: List[Tuple[str, str, int]], query: str) -> None:
     """Display search results in a formatted way."""
@@ -112,6 +198,8 @@ def main():
     parser = argparse.ArgumentParser(description="Search indexed screenshots")
     parser.add_argument('--query', required=True, help='Search query')
     parser.add_argument('--input', default=DESCRIPTIONS_FILE, help=f'Input JSON file (default: {DESCRIPTIONS_FILE})')
+    parser.add_argument('--embeddings', default=EMBEDDINGS_FILE, help=f'Input embeddings file (default: {EMBEDDINGS_FILE})')
+    parser.add_argument('--filenames', default=FILENAMES_FILE, help=f'Input filenames file for the embeddings (default: {FILENAMES_FILE})')
     parser.add_argument('--top', type=int, default=5, help='Number of top results to return (default: 5)')
     
     args = parser.parse_args()
@@ -123,8 +211,12 @@ def main():
     
     print(f"Loaded {len(descriptions)} screenshot descriptions from {args.input}")
     
+    embedded = ensure_embeddings(args.input, args.embeddings, args.filenames)
+    if embedded:
+        print(f"Embedded {embedded} existing descriptions into '{args.embeddings}'")
+    
     # Search
-    results = search_screenshots(args.query, descriptions, args.top)
+    results = search_screenshots(args.query, descriptions, args.top, args.embeddings, args.filenames)
     
     # Display results
     display_results(results, args.query)